@@ -23,6 +23,13 @@ def extract_text_from_pdf(file_bytes: bytes) -> str:
         try: _os.remove(path)
         except Exception: pass
 
+def read_cv_file(path: str) -> str:
+    with open(path, "rb") as f:
+        raw = f.read()
+    if path.lower().endswith(".pdf"):
+        return extract_text_from_pdf(raw)
+    return raw.decode("utf-8", errors="ignore")
+
 def parse_cv_and_goal(cv_text: str, goal: str) -> Dict[str, Any]:
     client = _get_client()
     system = "You extract concise skill summaries from resumes. Respond with JSON only."
@@ -29,20 +29,21 @@ def level_hint(clevel: str, tlevel: str):
     if i2 <= 2: return "intermediate"
     return "advanced"
 
+def finalize_query(sq: Dict, budget=None, hours=None) -> str:
+    q = sq["query"]
+    if budget and "budget_usd" not in sq: q += f" under ${int(budget)}"
+    if hours and "max_hours" not in sq:   q += f" under {int(hours)} hours"
+    return q
+
 def build_plan_from_skill_queries(skill_queries: List[Dict], budget=None, hours=None):
     plan = []
     for sq in skill_queries:
-        q = sq["query"]
-        if budget and "budget_usd" not in sq: q += f" under ${int(budget)}"
-        if hours and "max_hours" not in sq:   q += f" under {int(hours)} hours"
+        q = finalize_query(sq, budget, hours)
         df = top3_with_reasons(q)
         plan.append({"skill": sq.get("skill",""), "level": sq.get("level"), "query": q, "courses": df.to_dict(orient="records")})
     return plan
 
-def build_plan_from_profile(profile: Dict, goal_role: str, budget=None, hours=None):
-    roles = load_role_skills(goal_role)
-    req = roles.get("required", {})
-    gaps = compute_gaps(profile.get("current_skills",{}), req)
+def skill_queries_from_gaps(gaps: List[Tuple[str,str,str]], budget=None, hours=None) -> List[Dict]:
     queries = []
     for skill, clevel, tlevel in gaps:
         lh = level_hint(clevel, tlevel)
@@ -50,4 +51,11 @@ def build_plan_from_profile(profile: Dict, goal_role: str, budget=None, hours=No
         if budget: q += f" under ${int(budget)}"
         if hours:  q += f" under {int(hours)} hours"
         queries.append({"skill": skill, "level": tlevel, "query": q})
+    return queries
+
+def build_plan_from_profile(profile: Dict, goal_role: str, budget=None, hours=None):
+    roles = load_role_skills(goal_role)
+    req = roles.get("required", {})
+    gaps = compute_gaps(profile.get("current_skills",{}), req)
+    queries = skill_queries_from_gaps(gaps, budget, hours)
     return build_plan_from_skill_queries(queries, budget, hours)
@@ -0,0 +1,336 @@
+"""Offline plan generation for a cohort of CVs targeting one role.
+
+    python -m recsys.batch --cvs cvs/ --goal-role "data analyst" --out plans.jsonl
+    python -m recsys.batch --cvs cohort.jsonl --goal-role "data analyst" --out plans.parquet
+
+Input is a directory of .pdf/.txt/.md CVs or a JSONL file with one
+{"id", "cv_text" | "path", optional "goal_role"} object per line.
+Relative paths in a JSONL file are resolved against the file's directory.
+The output JSONL doubles as the checkpoint: ids already in it are skipped
+on restart and failed CVs are left out of it, so a rerun retries them.
+For a .parquet output the checkpoint is <out>.ckpt.jsonl and the parquet
+file is rewritten from it at the end of every run.
+
+Only stdlib, groq and cv_parser are imported at module level: PDF extraction
+workers are spawned and re-import this module, and must not pay for
+torch/faiss. The retrieval stack is imported when CohortPlanner is built.
+"""
+import argparse, json, multiprocessing, os, sys, threading, time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+
+from groq import RateLimitError
+
+from cv_parser import read_cv_file, parse_cv_and_goal
+
+CV_EXTS = (".pdf", ".txt", ".md")
+OUT_EXTS = (".jsonl", ".parquet")
+
+class RateLimiter:
+    """Spaces calls at least 60/per_minute seconds apart across threads."""
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+def iter_records(src: str):
+    if os.path.isdir(src):
+        for name in sorted(os.listdir(src)):
+            if name.lower().endswith(CV_EXTS):
+                yield {"id": name, "path": os.path.join(src, name)}
+        return
+    base = os.path.dirname(os.path.abspath(src))
+    with open(src, "r") as f:
+        for n, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+            except ValueError as e:
+                print(f"{src}:{n + 1}: skipping malformed line: {e}", file=sys.stderr)
+                continue
+            if not isinstance(rec, dict):
+                print(f"{src}:{n + 1}: skipping line, expected a JSON object", file=sys.stderr)
+                continue
+            rec.setdefault("id", str(n))
+            rec["id"] = str(rec["id"])
+            if isinstance(rec.get("path"), str) and rec["path"]:
+                rec["path"] = os.path.join(base, rec["path"])
+            yield rec
+
+def _has_text(rec) -> bool:
+    text = rec.get("cv_text")
+    return isinstance(text, str) and bool(text.strip())
+
+def _is_pdf(rec) -> bool:
+    path = rec.get("path")
+    return not _has_text(rec) and isinstance(path, str) and path.lower().endswith(".pdf")
+
+def _read_checkpoint(checkpoint: str):
+    if not os.path.exists(checkpoint):
+        return
+    with open(checkpoint, "r") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                pass  # truncated last line from an interrupted run
+
+def load_done_ids(checkpoint: str) -> set:
+    return {str(rec["id"]) for rec in _read_checkpoint(checkpoint) if "id" in rec}
+
+def trim_checkpoint(checkpoint: str):
+    """Cut a partly written last line so appended records start on a fresh line."""
+    if not os.path.exists(checkpoint):
+        return
+    with open(checkpoint, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+def _chunks(it, size):
+    buf = []
+    for x in it:
+        buf.append(x)
+        if len(buf) == size:
+            yield buf; buf = []
+    if buf:
+        yield buf
+
+def _json_default(o):
+    if hasattr(o, "item"):  # numpy scalars
+        return o.item()
+    return str(o)
+
+class CohortPlanner:
+    """Holds the per-run caches so identical gap profiles, queries and
+    (query, course) reasons are each computed once for the whole cohort.
+    Only successful LLM results are cached, so failures are retried later."""
+    retries = 4
+    backoff = 2.0   # seconds before the first retry on a rate-limit error
+
+    def __init__(self, budget=None, hours=None, llm_workers=4, llm_rpm=30):
+        from recsys.pipeline import top3_candidates, llm_reason, REC_COLS
+        self._top3, self._llm_reason, self._cols = top3_candidates, llm_reason, REC_COLS
+        self.budget, self.hours = budget, hours
+        self.limiter = RateLimiter(llm_rpm)
+        self.pool = ThreadPoolExecutor(max_workers=llm_workers)
+        self.reasons = {}   # (query, course_id) -> reason
+        self.courses = {}   # final query -> list of course records
+        self.plans = {}     # gap profile -> plan
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+    def _llm(self, fn, *args):
+        for attempt in range(self.retries + 1):
+            self.limiter.wait()
+            try:
+                return fn(*args)
+            except RateLimitError:
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def parse(self, items):
+        futs = [self.pool.submit(self._llm, parse_cv_and_goal, text, goal) for text, goal in items]
+        out = []
+        for fut in futs:
+            try:
+                out.append(fut.result())
+            except Exception as e:
+                out.append(e)
+        return out
+
+    def _retrieve(self, queries):
+        """Cache course records for the queries; return the ones that failed."""
+        queries = [q for q in dict.fromkeys(queries) if q not in self.courses]
+        failed = set()
+        if not queries:
+            return failed
+        frames = self._top3(queries)
+        futs = {}
+        for q, df in zip(queries, frames):
+            for _, row in df.iterrows():
+                key = (q, row["course_id"])
+                if key not in self.reasons and key not in futs:
+                    futs[key] = self.pool.submit(self._llm, self._llm_reason, row, q)
+        for q, df in zip(queries, frames):
+            keys = [(q, cid) for cid in df["course_id"]]
+            for key in keys:
+                fut = futs.pop(key, None)
+                if fut is None:
+                    continue
+                try:
+                    self.reasons[key] = fut.result()
+                except Exception as e:
+                    print(f"reason failed for {q!r}: {e}", file=sys.stderr)
+            if all(k in self.reasons for k in keys):
+                df["why"] = [self.reasons[k] for k in keys]
+                self.courses[q] = df[self._cols].reset_index(drop=True).to_dict(orient="records")
+            else:
+                failed.add(q)
+        return failed
+
+    def plan_for(self, gap_keys):
+        """Fill self.plans for every unseen gap profile in gap_keys and
+        return the profiles that could not be planned."""
+        from planner import skill_queries_from_gaps, finalize_query
+        todo = {}
+        for gaps in gap_keys:
+            if gaps in self.plans or gaps in todo:
+                continue
+            sqs = skill_queries_from_gaps(list(gaps), self.budget, self.hours)
+            todo[gaps] = [(sq, finalize_query(sq, self.budget, self.hours)) for sq in sqs]
+        failed_queries = self._retrieve([q for sqs in todo.values() for _, q in sqs])
+        failed = set()
+        for gaps, sqs in todo.items():
+            if any(q in failed_queries for _, q in sqs):
+                failed.add(gaps)
+                continue
+            self.plans[gaps] = [{"skill": sq.get("skill",""), "level": sq.get("level"),
+                                 "query": q, "courses": self.courses[q]} for sq, q in sqs]
+        return failed
+
+@lru_cache(maxsize=None)
+def _required(goal_role: str):
+    from planner import load_role_skills
+    return load_role_skills(goal_role).get("required", {})
+
+def _new_records(src, done):
+    seen = set(done)
+    for r in iter_records(src):
+        if r["id"] in seen:
+            if r["id"] not in done:
+                print(f"[{r['id']}] duplicate id in input, skipping", file=sys.stderr)
+            continue
+        seen.add(r["id"])
+        yield r
+
+def _chunk_texts(chunk, procs, failed):
+    """Return [(record, cv_text)] for the chunk; ids that fail go to `failed`.
+    PDFs are extracted in the process pool, plain text is read inline."""
+    futs = {i: procs.submit(read_cv_file, r["path"]) for i, r in enumerate(chunk) if _is_pdf(r)}
+    out = []
+    for i, r in enumerate(chunk):
+        if _has_text(r):
+            out.append((r, r["cv_text"]))
+            continue
+        if not (isinstance(r.get("path"), str) and r["path"]):
+            failed.append(r["id"])
+            print(f"[{r['id']}] no cv_text or path", file=sys.stderr)
+            continue
+        try:
+            out.append((r, futs[i].result() if i in futs else read_cv_file(r["path"])))
+        except Exception as e:
+            failed.append(r["id"])
+            print(f"[{r['id']}] text extraction failed: {e}", file=sys.stderr)
+    return out
+
+def write_parquet(checkpoint, out):
+    import pandas as pd
+    cols = ["id", "goal_role", "profile", "plan", "total_courses"]
+    df = pd.DataFrame(list(_read_checkpoint(checkpoint)), columns=cols)
+    for col in ["profile", "plan"]:
+        df[col] = df[col].map(lambda v: json.dumps(v, default=_json_default))
+    df.to_parquet(out, index=False)
+
+def run(src, out, goal_role, budget=None, hours=None, chunk_size=64,
+        extract_workers=2, llm_workers=4, llm_rpm=30):
+    """Plan every CV in src not yet in the checkpoint. Returns (n_ok, failed_ids)."""
+    if not out.endswith(OUT_EXTS):
+        raise ValueError(f"--out must end in {' or '.join(OUT_EXTS)}: {out}")
+    from planner import compute_gaps
+    checkpoint = out if out.endswith(".jsonl") else out + ".ckpt.jsonl"
+    trim_checkpoint(checkpoint)
+    done = load_done_ids(checkpoint)
+    records = list(_new_records(src, done))
+    total = len(records)
+    print(f"{len(done)} already done, {total} to process", file=sys.stderr)
+
+    # spawn, not fork: workers must not inherit torch/faiss state or live LLM threads
+    procs = None
+    if any(_is_pdf(r) for r in records):
+        procs = ProcessPoolExecutor(max_workers=extract_workers,
+                                    mp_context=multiprocessing.get_context("spawn"))
+    planner = CohortPlanner(budget, hours, llm_workers, llm_rpm)
+    n_ok, failed = 0, []
+    t0 = time.time()
+    try:
+        with open(checkpoint, "a") as sink:
+            for chunk in _chunks(records, chunk_size):
+                items = _chunk_texts(chunk, procs, failed)
+                goals = [r.get("goal_role") or goal_role for r, _ in items]
+                profiles = planner.parse([(text, g) for (_, text), g in zip(items, goals)])
+
+                rows = []
+                for (r, _), g, profile in zip(items, goals, profiles):
+                    if isinstance(profile, Exception):
+                        failed.append(r["id"])
+                        print(f"[{r['id']}] CV parse failed: {profile}", file=sys.stderr)
+                        continue
+                    gaps = tuple(compute_gaps(profile.get("current_skills", {}), _required(g)))
+                    rows.append((r, g, profile, gaps))
+                try:
+                    bad = planner.plan_for([gaps for *_, gaps in rows])
+                except Exception as e:
+                    failed.extend(r["id"] for r, *_ in rows)
+                    print(f"retrieval failed for chunk of {len(rows)}: {e}", file=sys.stderr)
+                    continue
+
+                for r, g, profile, gaps in rows:
+                    if gaps in bad:
+                        failed.append(r["id"])
+                        print(f"[{r['id']}] plan incomplete, will retry on next run", file=sys.stderr)
+                        continue
+                    plan = planner.plans[gaps]
+                    rec = {"id": r["id"], "goal_role": g, "profile": profile, "plan": plan,
+                           "total_courses": sum(len(p["courses"]) for p in plan)}
+                    sink.write(json.dumps(rec, default=_json_default) + "\n")
+                    n_ok += 1
+                sink.flush()
+
+                dt = time.time() - t0
+                print(f"{n_ok + len(failed)}/{total} CVs ({len(failed)} failed) | "
+                      f"{len(planner.plans)} unique gap profiles, {len(planner.courses)} unique queries | "
+                      f"{n_ok / dt if dt else 0.0:.2f} CVs/s", file=sys.stderr)
+    finally:
+        planner.close()
+        if procs is not None:
+            procs.shutdown(cancel_futures=True)
+
+    if failed:
+        print(f"{len(failed)} CVs failed and are not in {checkpoint}: {', '.join(failed)}", file=sys.stderr)
+    if out.endswith(".parquet"):
+        write_parquet(checkpoint, out)
+        print(f"Wrote {out}", file=sys.stderr)
+    return n_ok, failed
+
+def main():
+    ap = argparse.ArgumentParser(description="Build learning plans for a cohort of CVs.")
+    ap.add_argument("--cvs", required=True, help="directory of CVs or JSONL file")
+    ap.add_argument("--goal-role", required=True)
+    ap.add_argument("--out", required=True, help=".jsonl or .parquet")
+    ap.add_argument("--budget-usd", type=float, default=None)
+    ap.add_argument("--max-hours", type=float, default=None)
+    ap.add_argument("--chunk-size", type=int, default=64)
+    ap.add_argument("--extract-workers", type=int, default=2, help="processes for PDF text extraction")
+    ap.add_argument("--llm-workers", type=int, default=4)
+    ap.add_argument("--llm-rpm", type=float, default=30, help="max LLM requests per minute")
+    args = ap.parse_args()
+    if not args.out.endswith(OUT_EXTS):
+        ap.error(f"--out must end in {' or '.join(OUT_EXTS)}")
+    run(args.cvs, args.out, args.goal_role, args.budget_usd, args.max_hours,
+        args.chunk_size, args.extract_workers, args.llm_workers, args.llm_rpm)
+
+if __name__ == "__main__":
+    main()
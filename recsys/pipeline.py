@@ -67,28 +67,33 @@ Write ONE friendly sentence on why this fits. Mention level match and one numeri
     )
     return r.choices[0].message.content.strip()
 
-def top3_with_reasons(query: str, k_candidates: int = 200):
-    a = load_assets()
-    model, index = a["model"], a["index"]
-    course_ids, popularity, recency = a["course_ids"], a["popularity"], a["recency"]
-    details_df = a["details_df"]
-
-    q = model.encode([query], normalize_embeddings=True).astype(np.float32)
-    D, I = index.search(q, k_candidates)
-    sims, ids = D[0], course_ids[I[0]]
+REC_COLS = ["course_title","subject","level","price","content_duration",
+            "num_reviews","combined_rating","url","why","score"]
 
+def _rank_candidates(a, sims, rows):
     cand = pd.DataFrame({
-        "course_id": ids,
+        "course_id": a["course_ids"][rows],
         "cosine_sim": sims,
-        "popularity_score": popularity[I[0]],
-        "recency_score": recency[I[0]],
+        "popularity_score": a["popularity"][rows],
+        "recency_score": a["recency"][rows],
     })
     cand["score"] = 0.85*cand["cosine_sim"] + 0.14*cand["popularity_score"] + 0.01*cand["recency_score"]
 
     picked = _mmr_selection(cand, k=3, lambda_=0.7)
-    out = picked.merge(details_df, on="course_id", how="left")
-    out["why"] = out.apply(lambda r: llm_reason(r, query), axis=1)
+    return picked.merge(a["details_df"], on="course_id", how="left")
 
-    cols = ["course_title","subject","level","price","content_duration",
-            "num_reviews","combined_rating","url","why","score"]
-    return out[cols].reset_index(drop=True)
+def top3_candidates(queries, k_candidates: int = 200, batch_size: int = 64):
+    """Rank the top-3 courses for each query (no LLM reasons) using one
+    batched encode and one index search for the whole list."""
+    if not queries:
+        return []
+    a = load_assets()
+    q = a["model"].encode(list(queries), batch_size=batch_size,
+                          normalize_embeddings=True).astype(np.float32)
+    D, I = a["index"].search(q, k_candidates)
+    return [_rank_candidates(a, D[j], I[j]) for j in range(len(queries))]
+
+def top3_with_reasons(query: str, k_candidates: int = 200):
+    out = top3_candidates([query], k_candidates)[0]
+    out["why"] = out.apply(lambda r: llm_reason(r, query), axis=1)
+    return out[REC_COLS].reset_index(drop=True)
@@ -0,0 +1,203 @@
+import json
+import time
+
+import httpx
+import pandas as pd
+import pytest
+from groq import RateLimitError
+
+from recsys import batch, pipeline
+
+
+def _courses(query):
+    return pd.DataFrame({
+        "course_id": [1, 2],
+        "course_title": [f"{query} A", f"{query} B"],
+        "subject": ["x", "x"], "level": ["All", "All"], "price": [0, 20],
+        "content_duration": [1.0, 2.0], "num_reviews": [10, 20],
+        "combined_rating": [4.5, 4.0], "url": ["u1", "u2"], "score": [0.9, 0.8],
+    })
+
+
+@pytest.fixture
+def stubs(monkeypatch):
+    calls = {"retrieve": [], "reason": [], "parse": []}
+
+    def top3_candidates(queries):
+        calls["retrieve"].append(list(queries))
+        return [_courses(q) for q in queries]
+
+    def llm_reason(row, query):
+        calls["reason"].append((query, row["course_id"]))
+        return f"why {row['course_id']}"
+
+    def parse_cv_and_goal(text, goal):
+        calls["parse"].append(text)
+        return {"current_skills": {"python": text}, "summary": ""}
+
+    monkeypatch.setattr(pipeline, "top3_candidates", top3_candidates)
+    monkeypatch.setattr(pipeline, "llm_reason", llm_reason)
+    monkeypatch.setattr(batch.CohortPlanner, "backoff", 0.0)
+    monkeypatch.setattr(batch, "parse_cv_and_goal", parse_cv_and_goal)
+    monkeypatch.setattr(batch, "_required", lambda goal: {"python": "advanced", "sql": "basic"})
+    return calls
+
+
+def _write_jsonl(path, recs):
+    path.write_text("".join(json.dumps(r) + "\n" for r in recs))
+
+
+def test_iter_records_dir_and_jsonl(tmp_path):
+    d = tmp_path / "cvs"
+    d.mkdir()
+    (d / "b.txt").write_text("b")
+    (d / "a.pdf").write_bytes(b"")
+    (d / "notes.csv").write_text("skip")
+    assert [r["id"] for r in batch.iter_records(str(d))] == ["a.pdf", "b.txt"]
+
+    src = tmp_path / "cohort.jsonl"
+    src.write_text('{"id": 7, "cv_text": "x"}\n\n{"path": "cvs/b.txt"}\n')
+    recs = list(batch.iter_records(str(src)))
+    assert recs[0] == {"id": "7", "cv_text": "x"}
+    assert recs[1]["id"] == "2"
+    assert recs[1]["path"] == str(d / "b.txt")
+
+
+def test_iter_records_skips_malformed_lines(tmp_path, capsys):
+    src = tmp_path / "cohort.jsonl"
+    src.write_text('{"id": "a", "cv_text": "x"}\nnot json\n[1, 2]\n{"id": "b", "cv_text": "y"}\n')
+    assert [r["id"] for r in batch.iter_records(str(src))] == ["a", "b"]
+    err = capsys.readouterr().err
+    assert ":2: skipping malformed line" in err
+    assert ":3: skipping line" in err
+
+
+def test_resume_after_truncated_line(tmp_path):
+    ckpt = tmp_path / "out.jsonl"
+    ckpt.write_text('{"id": "a"}\n{"id": "b"}\n{"id": "c", "pa')
+    assert batch.load_done_ids(str(ckpt)) == {"a", "b"}
+
+    batch.trim_checkpoint(str(ckpt))
+    with open(ckpt, "a") as f:
+        f.write('{"id": "d"}\n')
+    assert batch.load_done_ids(str(ckpt)) == {"a", "b", "d"}
+
+
+def test_rate_limiter_spacing():
+    limiter = batch.RateLimiter(per_minute=600)  # 0.1s apart
+    t0 = time.monotonic()
+    for _ in range(4):
+        limiter.wait()
+    assert time.monotonic() - t0 >= 0.3
+
+
+def test_plan_for_dedupes(stubs):
+    planner = batch.CohortPlanner(llm_rpm=0)
+    try:
+        g1 = (("python", "basic", "advanced"), ("sql", "none", "basic"))
+        g2 = (("sql", "none", "basic"),)
+        planner.plan_for([g1, g1, g2])
+        planner.plan_for([g2])
+    finally:
+        planner.close()
+
+    assert stubs["retrieve"] == [["from basics to advanced python course", "beginner sql course"]]
+    assert len(stubs["reason"]) == 4
+    assert set(planner.plans) == {g1, g2}
+    assert planner.plans[g2][0]["courses"][0]["why"] == "why 1"
+
+
+def _rate_limited():
+    req = httpx.Request("POST", "https://api.groq.com")
+    return RateLimitError("429", response=httpx.Response(429, request=req), body=None)
+
+
+def test_reason_rate_limit_is_retried(stubs, monkeypatch):
+    fails = {"n": 2}
+
+    def llm_reason(row, query):
+        if fails["n"]:
+            fails["n"] -= 1
+            raise _rate_limited()
+        return "ok"
+    monkeypatch.setattr(pipeline, "llm_reason", llm_reason)
+    planner = batch.CohortPlanner(llm_rpm=0, llm_workers=1)
+    try:
+        assert planner.plan_for([(("sql", "none", "basic"),)]) == set()
+    finally:
+        planner.close()
+    assert [c["why"] for c in planner.courses["beginner sql course"]] == ["ok", "ok"]
+
+
+def test_reason_failure_is_not_cached(stubs, monkeypatch):
+    gaps = (("sql", "none", "basic"),)
+
+    def llm_reason(row, query):
+        if row["course_id"] == 2:
+            raise RuntimeError("GROQ_API_KEY not set")
+        return "ok"
+    monkeypatch.setattr(pipeline, "llm_reason", llm_reason)
+    planner = batch.CohortPlanner(llm_rpm=0)
+    try:
+        assert planner.plan_for([gaps]) == {gaps}
+        assert planner.courses == {} and planner.plans == {}
+
+        calls = []
+        monkeypatch.setattr(planner, "_llm_reason",
+                            lambda row, q: calls.append(row["course_id"]) or "ok")
+        assert planner.plan_for([gaps]) == set()
+    finally:
+        planner.close()
+    assert calls == [2]  # the reason that succeeded is not paid for again
+    assert [c["why"] for c in planner.plans[gaps][0]["courses"]] == ["ok", "ok"]
+
+
+def test_run_skips_bad_records_and_resumes(stubs, tmp_path):
+    src = tmp_path / "cohort.jsonl"
+    _write_jsonl(src, [
+        {"id": "a", "cv_text": "basic"},
+        {"id": "b", "cv_text": "basic"},
+        {"id": "a", "cv_text": "basic"},
+        {"id": "empty", "cv_text": ""},
+        {"id": "nothing"},
+        {"id": "missing", "path": "nope.txt"},
+    ])
+    out = tmp_path / "plans.parquet"
+    n_ok, failed = batch.run(str(src), str(out), "data analyst", llm_rpm=0)
+    assert (n_ok, failed) == (2, ["empty", "nothing", "missing"])
+    assert stubs["parse"] == ["basic", "basic"]
+    assert len(stubs["retrieve"]) == 1
+    df = pd.read_parquet(out)
+    assert sorted(df["id"]) == ["a", "b"]
+    assert json.loads(df["plan"][0])[0]["skill"] == "python"
+
+    n_ok, failed = batch.run(str(src), str(out), "data analyst", llm_rpm=0)
+    assert (n_ok, failed) == (0, ["empty", "nothing", "missing"])
+    assert stubs["parse"] == ["basic", "basic"]
+    assert len(pd.read_parquet(out)) == 2
+
+
+def test_run_leaves_failed_plans_for_next_run(stubs, tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline, "llm_reason", lambda row, q: 1 / 0)
+    src = tmp_path / "cohort.jsonl"
+    _write_jsonl(src, [{"id": "a", "cv_text": "basic"}])
+    out = tmp_path / "plans.jsonl"
+    assert batch.run(str(src), str(out), "data analyst", llm_rpm=0) == (0, ["a"])
+    assert batch.load_done_ids(str(out)) == set()
+
+    monkeypatch.setattr(pipeline, "llm_reason", lambda row, q: "ok")
+    assert batch.run(str(src), str(out), "data analyst", llm_rpm=0) == (1, [])
+    assert batch.load_done_ids(str(out)) == {"a"}
+
+
+def test_run_empty_checkpoint_parquet(stubs, tmp_path):
+    src = tmp_path / "cohort.jsonl"
+    src.write_text("")
+    out = tmp_path / "plans.parquet"
+    assert batch.run(str(src), str(out), "data analyst") == (0, [])
+    assert pd.read_parquet(out).empty
+
+
+def test_run_rejects_unknown_output_extension(tmp_path):
+    with pytest.raises(ValueError):
+        batch.run(str(tmp_path), str(tmp_path / "plans.csv"), "data analyst")